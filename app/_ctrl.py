@@ -84,6 +84,7 @@ class Ctrl_GraphicsView:
         zoom_factor = 1.0015**event.angleDelta().y()
         self.scale(zoom_factor, zoom_factor)
         self.translate(-pos.x(), -pos.y())
+        self.scene().setZoom(self.transform().m11())
 
     def keyPressEvent(self, event):
         if event.key() in {Qt.Key_Minus, Qt.Key_Equal}:
@@ -96,6 +97,7 @@ class Ctrl_GraphicsView:
                 zoom_factor = 1 / zoom_factor
             self.scale(zoom_factor, zoom_factor)
             self.translate(-pos.x(), -pos.y())
+            self.scene().setZoom(self.transform().m11())
         else:
             super().keyPressEvent(event)
 
@@ -107,3 +109,7 @@ class Ctrl_MainWindow:
             self.close()
         elif event.key() == Qt.Key_Space:
             self._model.toggle_gentle()
+        elif event.key() == Qt.Key_P:
+            self.toggleProfilerOverlay()
+        elif event.key() == Qt.Key_E:
+            self.exportProfile()
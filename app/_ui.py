@@ -1,5 +1,6 @@
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QColor, QPainter
+from PyQt5.QtWidgets import QLabel
 
 from utilities.wavelength_to_rgb import rgb
 
@@ -74,6 +75,8 @@ class Ui_InteractiveGraphics:
 
 class Ui_GraphicsScene:
     scale = 230.0  # pixels per meter
+    lodRadius = 2.0  # smaller items are not shown, pixels
+    expandRadius = 40.0  # larger collapsed items are expanded, pixels
 
 
 class Ui_GraphicsView:
@@ -93,10 +96,18 @@ class Ui_GraphicsView:
 
 class Ui_MainWindow:
 
+    profilerInterval = 500  # milliseconds between overlay updates
+    profileFilename = 'profile'  # .csv and .json are appended
+
     def __init__(self):
         arrangement = self._model._repository.arrangement
         self.setWindowTitle(f'Rigid Packer: {arrangement}')
         self.statusBar().setStyleSheet('background-color: darkgray;')
+        self.__profiler_label = QLabel()
+        self.__profiler_label.hide()
+        self.statusBar().addPermanentWidget(self.__profiler_label)
+        self.__profiler_timer = QTimer(self)
+        self.__profiler_timer.timeout.connect(self.updateProfilerOverlay)
         self.resize(800, 600)
         self.setCentralWidget(self._graphics_view)
 
@@ -105,3 +116,39 @@ class Ui_MainWindow:
         if item.product_name:
             message += f'    |    {item.product_name}'
         self.statusBar().showMessage(message)
+
+    def toggleProfilerOverlay(self):
+        profiler = self._model.profiler
+        profiler.enabled = not profiler.enabled
+        self.__profiler_label.setVisible(profiler.enabled)
+        if profiler.enabled:
+            self.__profiler_timer.start(self.profilerInterval)
+        else:
+            self.__profiler_timer.stop()
+
+    def updateProfilerOverlay(self):
+        summary = self._model.profiler.summary()
+        frames = self._model.frame_statistics
+        phases = '  '.join(
+            f'{phase} {milliseconds:.1f}'
+            for phase, milliseconds in summary.phase_times.items()
+        )
+        container_id, milliseconds = summary.slowest_subworld
+        self.__profiler_label.setText(
+            f'{phases} ms    |    '
+            f'awake {summary.awake_bodies}  contacts {summary.contacts}'
+            f'    |    slowest #{container_id} {milliseconds:.1f} ms'
+            f'    |    p50 {frames.p50_step_time*1000:.1f}'
+            f'  p99 {frames.p99_step_time*1000:.1f} ms'
+            f'  dropped {frames.dropped_frames}  '
+        )
+
+    def exportProfile(self):
+        profiler = self._model.profiler
+        csv_filename = self.profileFilename + '.csv'
+        trace_filename = self.profileFilename + '.json'
+        profiler.export_csv(csv_filename)
+        profiler.export_chrome_trace(trace_filename)
+        self.statusBar().showMessage(
+            f'  profile is exported to {csv_filename} and {trace_filename}'
+        )
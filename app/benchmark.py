@@ -0,0 +1,163 @@
+#! python3.7
+"""
+Times stuffing, stepping and re-parenting on synthetic hierarchies.
+
+usage: benchmark.py [SIZE ...] [--frames N] [--rounds N]
+
+SIZE is one of the presets (1k, 10k, 100k) or DEPTH:FAN_OUT.
+"""
+
+import os
+import sqlite3
+import sys
+from argparse import ArgumentParser
+from random import Random
+from statistics import mean
+from string import ascii_lowercase
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+
+from repository import Repository
+from model import Model
+
+
+PRESETS = {
+    '1k': (3, 10),  # 1110 items
+    '10k': (4, 10),  # 11110 items
+    '100k': (5, 10),  # 111110 items
+}
+
+_SCHEMA = """
+    CREATE TABLE arrangement (
+        arrangement_id INTEGER NOT NULL UNIQUE,
+        name TEXT NOT NULL UNIQUE,
+        PRIMARY KEY(arrangement_id AUTOINCREMENT)
+    );
+    CREATE TABLE item (
+        item_id INTEGER NOT NULL UNIQUE,
+        name TEXT NOT NULL UNIQUE,
+        product_name TEXT,
+        PRIMARY KEY(item_id AUTOINCREMENT)
+    );
+    CREATE TABLE placement (
+        placement_id INTEGER NOT NULL UNIQUE,
+        arrangement_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL UNIQUE,
+        parent_id INTEGER,
+        FOREIGN KEY(item_id) REFERENCES item(item_id),
+        FOREIGN KEY(parent_id) REFERENCES item(item_id),
+        FOREIGN KEY(arrangement_id) REFERENCES arrangement(arrangement_id),
+        PRIMARY KEY(placement_id AUTOINCREMENT)
+    );
+    """
+
+
+def generate(filename, depth, fan_out, seed=0):
+    """Write a hierarchy with fan_out children per container to the file."""
+    random = Random(seed)
+    items, placements = [], []
+    parents = [None]
+    for _ in range(depth):
+        level = []
+        for parent_id in parents:
+            for _ in range(fan_out):
+                item_id = len(items) + 1
+                letter = random.choice(ascii_lowercase)
+                items.append((item_id, f'{letter}{item_id}'))
+                placements.append((1, item_id, parent_id))
+                level.append(item_id)
+        parents = level
+    connection = sqlite3.connect(filename)
+    connection.executescript(_SCHEMA)
+    connection.execute(
+        "INSERT INTO arrangement VALUES (1, ?)",
+        (Repository.default_arrangement,)
+    )
+    connection.executemany("INSERT INTO item VALUES (?, ?, NULL)", items)
+    connection.executemany(
+        """
+        INSERT INTO placement (arrangement_id, item_id, parent_id)
+        VALUES (?, ?, ?)
+        """,
+        placements
+    )
+    connection.commit()
+    connection.close()
+    return len(items)
+
+
+def _timed(function, *args):
+    start = perf_counter()
+    function(*args)
+    return perf_counter() - start
+
+
+def run(depth, fan_out, frames, rounds, seed=0):
+    """Return seconds spent in each phase for the given hierarchy shape."""
+    random = Random(seed)
+    timings = {}
+    with TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'benchmark.db')
+        generate(filename, depth, fan_out, seed)
+        model = Model(Repository(filename), target_fps=30.0)
+        timings['stuff'] = [_timed(model.stuff)]
+        step_b2subworlds = model._step_b2subworlds
+        timings['step'] = [_timed(step_b2subworlds) for _ in range(frames)]
+        timings['shake_out'] = []
+        timings['take_picked_up'] = []
+        for _ in range(rounds):
+            # current ones, as earlier rounds may have emptied containers
+            containers = [
+                container for container in model._and_childrened_descendants
+                if container is not model
+            ]
+            if len(containers) < 2: break
+            source, target = random.sample(containers, 2)
+            item = random.choice(source._children)
+            timings['shake_out'].append(_timed(item.shake_out))
+            source.stuff_by([item])
+            item = random.choice(source._children)
+            if item is target or item in target._ancestors: continue
+            item.toggle_picked_up()
+            timings['take_picked_up'].append(
+                _timed(target.take_picked_up, (0.0, 0.0))
+            )
+        model._repository.flush()
+        model._repository = None  # close the database before cleanup
+    return timings
+
+
+def report(name, items, timings):
+    print(f'{name}: {items} items')
+    for phase, seconds in timings.items():
+        print(
+            f'  {phase:<16}'
+            f'{mean(seconds)*1000:>10.3f} ms mean'
+            f'{max(seconds)*1000:>10.3f} ms max'
+            f'{len(seconds):>8} runs'
+        )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('sizes', nargs='*', default=['1k'], metavar='SIZE')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=20)
+    arguments = parser.parse_args()
+    app = QApplication(sys.argv[:1])
+    for size in arguments.sizes:
+        if size in PRESETS:
+            depth, fan_out = PRESETS[size]
+        else:
+            depth, fan_out = map(int, size.split(':'))
+        items = sum(fan_out**level for level in range(1, depth + 1))
+        timings = run(depth, fan_out, arguments.frames, arguments.rounds)
+        report(size, items, timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,659 @@
+from typing import List, Tuple
+from contextlib import contextmanager
+from multiprocessing import Pipe, Process
+from operator import attrgetter
+from time import perf_counter
+
+from repository import ItemData, RepositoryBase
+from model_body import BodyContainerMixin, BodyHierarchyMixin
+from utilities.geometry import EnclosedAreas, enclosing_area
+from utilities.slots import slots_of
+
+
+class _ContainerItem:
+    """Item data of the repository item in the hierarchy of items."""
+
+    __slots__ = ()
+    _SLOTS = (
+        'id', 'name', 'product_name', 'is_root',
+        'self_mass', 'self_volume', 'saved_position',
+        '_parent', '_children',
+    )
+
+    def __init__(self, item: ItemData):
+        self.id = item.id
+        self.name = item.name
+        self.product_name = item.product_name
+        self.is_root = item.is_root
+        self.self_mass = item.self_mass
+        self.self_volume = item.self_volume
+        self.saved_position = item.saved_position
+        self._parent: _ContainerItem = None
+        self._children: List[_ContainerItem] = []
+
+    @property
+    def _ancestors(self):
+        """Return ancestors from parent to root."""
+        ancestors = []
+        ancestor = self._parent
+        while ancestor is not None:
+            ancestors.append(ancestor)
+            ancestor = ancestor._parent
+        return ancestors
+
+    @property
+    def _descendants(self):
+        """Yield descendants in depth-first order."""
+        stack = self._children[::-1]
+        while stack:
+            descendant = stack.pop()
+            yield descendant
+            stack += descendant._children[::-1]
+
+    def _iter_childrened(self):
+        """Yield self and descendants that have children."""
+        if not self._children: return
+        yield self
+        for descendant in self._descendants:
+            if descendant._children: yield descendant
+
+    def _is_descendant_of(self, item):
+        ancestor = self._parent
+        while ancestor is not None:
+            if ancestor is item: return True
+            ancestor = ancestor._parent
+        return False
+
+    @property
+    def nesting_level(self):
+        return self._parent.nesting_level + 1 if self._parent else 0
+
+    def stuff_by(self, new_children):
+        self._children += new_children  # +C
+        for new_child in new_children: new_child._parent = self  # +P
+
+    def shake_out(self):
+        self._parent._children.remove(self)  # −C
+        self._parent = None  # −P
+
+
+class _BodyContainerBase(BodyContainerMixin, _ContainerItem):
+
+    # shape area ~ real item volume
+
+    __slots__ = ()
+    _SLOTS = (
+        '_model', '_collapsed', '_enclosed_areas', '_children_mass',
+        '_enclosed_mass', '_enclosed_area',
+    )
+
+    def __init__(self, item, time_step):
+        _ContainerItem.__init__(self, item)
+        BodyContainerMixin.__init__(self, time_step)
+        self._model: PackingEngine
+        # total mass and area of the container whose children are not loaded
+        self._collapsed: Tuple[float, float] = None
+        # created with the first children, as most items are leaves
+        self._enclosed_areas: EnclosedAreas = None
+        self._children_mass = 0.0
+        # mass and area counted in the parent’s sums
+        self._enclosed_mass, self._enclosed_area = 0.0, 0.0
+
+    def _adjust_aggregates(self):
+        """Calculate mass and area with all children, adjust parent sums."""
+        if self._collapsed:
+            mass, area = self._collapsed
+        elif self._enclosed_areas is None:
+            mass, area = self.self_mass, self.self_volume
+        else:
+            mass = self.self_mass + self._children_mass
+            area = self._enclosed_areas.enclosing_area(
+                self.self_volume,
+                (child._enclosed_area for child in self._children),
+            )
+        self._set_total_mass_and_area(mass, area)
+        parent = self._parent
+        if not parent: return
+        parent._children_mass += mass - self._enclosed_mass
+        parent._enclosed_areas.replace(self._enclosed_area, area)
+        self._enclosed_mass, self._enclosed_area = mass, area
+
+    def _propagate_aggregates(self):
+        """
+        Adjust aggregates of self and ancestors, or only mark them
+        if the model defers aggregates.
+        """
+        dirty = self._model._dirty_aggregates
+        if dirty is None:
+            for self_or_ancestor in (self, *self._ancestors):
+                self_or_ancestor._adjust_aggregates()
+            return
+        item = self
+        while item is not None and item not in dirty:
+            dirty[item] = None
+            item = item._parent
+
+    def stuff_by(self, new_children, throwing_target=None):
+        if self._collapsed: self._model.expand(self)
+        model = self._model
+        model._hierarchy_changes += 1
+        # stepped by the physics thread from here on
+        self._create_b2subworld()
+        containers = model._and_childrened_descendants
+        if not self._children: containers[self] = None
+        for new_child in new_children:
+            for container in new_child._iter_childrened():
+                containers[container] = None
+        self._wake_b2subworld()
+        self._wake_b2superworlds()
+        deferred = model._dirty_aggregates is not None
+        if self._enclosed_areas is None:
+            self._enclosed_areas = EnclosedAreas()
+        for new_child in new_children:
+            new_child._parent = self  # for the subworld
+            # asleep until placed, not to collide at the origin
+            new_child._create_b2body(awake=not deferred)
+            new_child._enclosed_mass = mass = new_child._total_mass
+            new_child._enclosed_area = area = new_child._area
+            self._children_mass += mass
+            self._enclosed_areas.add(area)
+        # children are stepped only with their bodies
+        super().stuff_by(new_children)
+        self._reset_b2children_cache()
+        self._propagate_aggregates()
+        if deferred:
+            model._deferred_placements.append(
+                (self, new_children, throwing_target)
+            )
+        else:
+            self._place_children(new_children, throwing_target)
+
+    def _place_children(self, children, throwing_target=None):
+        self._wake_b2subworld()
+        if throwing_target is not None:
+            self._throw_in(children, throwing_target)
+            return
+        # warm start from the saved layout, new items are thrown in
+        placed = [child for child in children if child.saved_position]
+        thrown = [child for child in children if not child.saved_position]
+        self._place_in(placed)
+        if thrown: self._throw_in(thrown)
+
+    def shake_out(self):
+        parent = self._parent
+        ancestors = self._ancestors
+        containers = self._model._and_childrened_descendants
+        self._model._hierarchy_changes += 1
+        super().shake_out()
+        if parent._children:
+            parent._children_mass -= self._enclosed_mass
+        else:
+            parent._children_mass = 0.0
+        parent._enclosed_areas.remove(self._enclosed_area)
+        parent._reset_b2children_cache()
+        for container in self._iter_childrened(): del containers[container]
+        if not parent._children: del containers[parent]
+        parent._propagate_aggregates()
+        for ancestor in ancestors: ancestor._awake_b2bodies()
+
+
+class BodyContainer(_BodyContainerBase):
+    """
+    Non-root container with attributes in slots, as there are many
+    of them.
+    """
+
+    __slots__ = slots_of(_BodyContainerBase)
+
+
+class PackingEngine(BodyHierarchyMixin, _BodyContainerBase):
+    """
+    Builds the subworld hierarchy from the repository and steps it
+    as fast as possible, without GUI and frame rate limit.
+    """
+
+    _container_class = BodyContainer
+
+    def __init__(self, repository, time_step=1.0/30):
+        _BodyContainerBase.__init__(self, repository._root, time_step)
+        BodyHierarchyMixin.__init__(self)
+        self._repository: RepositoryBase = repository
+        # item data lists by parent id, of the items not created yet
+        self._tree = {}
+        # ordered set of items to adjust at the end of a bulk operation
+        self._dirty_aggregates = None
+        self._deferred_placements = []
+        # containers to seed by packing after the deferred placements
+        self._deferred_packings = []
+        # nesting level from which containers are stuffed only on demand
+        self.lazy_depth: int = None
+        # place thrown in children by circle packing once the tree is built
+        self.seed_packing = False
+        # worker processes stepping subtrees, also by step() if several
+        self.processes = 1
+        self.__shard_pool: _ShardPool = None
+        # counts stuffings and shakings out, to rebuild the shards
+        self._hierarchy_changes = 0
+
+    @contextmanager
+    def _deferred_aggregates(self):
+        """
+        Adjust aggregates of changed items once, deepest first, place
+        their new children and seed packings at the end of the bulk
+        operation.
+        """
+        if self._dirty_aggregates is not None:
+            yield  # nested in another bulk operation
+            return
+        self._dirty_aggregates = {}
+        try:
+            yield
+        finally:
+            dirty = self._dirty_aggregates
+            self._dirty_aggregates = None
+            for item in sorted(
+                dirty, key=attrgetter('nesting_level'), reverse=True
+            ):
+                item._adjust_aggregates()
+            placements = self._deferred_placements
+            self._deferred_placements = []
+            for container, children, throwing_target in placements:
+                container._place_children(children, throwing_target)
+            packings = self._deferred_packings
+            self._deferred_packings = []
+            self.__seed_packing(packings)
+
+    def __aggregate(self, item):
+        """Return total mass and area of the item in the kept tree."""
+        masses, areas = [item.self_mass], []
+        for proto in self._tree.get(item.id, ()):
+            mass, area = self.__aggregate(proto)
+            masses.append(mass)
+            areas.append(area)
+        return sum(masses), enclosing_area(item.self_volume, areas)
+
+    def stuff(self, container=None, tree=None):
+        """Create and place all container’s descendants."""
+        if tree is None: tree = self._tree = self._repository.load_tree()
+        self.build_from(tree, container)
+
+    def build_from(self, tree, container=None):
+        """
+        Create and place container’s descendants from the item data lists
+        by parent id, level by level, in one bulk operation. Lists of the
+        collapsed containers are kept until they are expanded.
+        """
+        container = container or self
+        container._model = self
+        if tree is not self._tree:
+            for parent_id, protos in tree.items():
+                self._tree.setdefault(parent_id, []).extend(protos)
+        tree = self._tree
+        lazy_depth = self.lazy_depth
+        fresh = []  # containers with only new children
+        with self._deferred_aggregates():
+            level = [container]
+            while level:
+                next_level = []
+                for parent in level:
+                    if parent._collapsed:  # with the kept children
+                        self.expand(parent)
+                        continue
+                    protos = tree.pop(parent.id, None)
+                    if not protos: continue
+                    children = [
+                        self._container_class(proto, self._time_step)
+                        for proto in protos
+                    ]
+                    collapsing = lazy_depth is not None and \
+                        parent.nesting_level >= lazy_depth-1
+                    for proto, child in zip(protos, children):
+                        child._model = self
+                        if collapsing and tree.get(child.id):
+                            child._collapsed = self.__aggregate(proto)
+                        if not child._collapsed: next_level.append(child)
+                    if not parent._children: fresh.append(parent)
+                    parent.stuff_by(children)
+                level = next_level
+            # by the outermost bulk operation, once radii are final
+            if self.seed_packing: self._deferred_packings += fresh
+
+    def __seed_packing(self, containers):
+        """Pack children of the containers without the saved layout."""
+        for container in containers:
+            if any(child.saved_position for child in container._children):
+                continue
+            container._pack_in()
+
+    def expand(self, container):
+        """Stuff the collapsed container by its children."""
+        if not container._collapsed: return
+        container._collapsed = None
+        self.build_from(self._tree, container)
+
+    def step(self):
+        """
+        Advance all subworlds by one time step, or as many as the frame
+        budget allows if the stepping policy is overloaded.
+        """
+        phase = self.profiler.phase
+        self.profiler.next_frame()
+        policy = self.stepping_policy
+        with phase('step'):
+            start = perf_counter()
+            if policy and policy.overloaded:
+                self._step_b2subworlds_gently(budget=policy.frame_budget)
+                self.__unsync_shards()
+            elif not self.__step_sharded(1, self.processes):
+                self._step_b2subworlds()
+                self.__unsync_shards()
+            if policy: policy.frame_done(perf_counter() - start)
+        if self._b2bodies_to_destroy:
+            with phase('destroy'): self._destroy_b2bodies_to_destroy()
+
+    def step_gently(self, focus=None):
+        """Advance focus subworlds by one time step, the rest if in time."""
+        phase = self.profiler.phase
+        self.profiler.next_frame()
+        with phase('step_gently'): self._step_b2subworlds_gently(focus)
+        self.__unsync_shards()
+        if self._b2bodies_to_destroy: self._destroy_b2bodies_to_destroy()
+
+    def simulate(self, frames, processes=None):
+        """
+        Step all subworlds for the number of frames. If several processes
+        are given, subtrees are stepped in them, by default in the ones
+        of the processes attribute.
+        """
+        if processes is None: processes = self.processes
+        if self.__step_sharded(frames, processes): return
+        for _ in range(frames): self.step()
+
+    def close(self):
+        """Stop the worker processes of the shards."""
+        if not self.__shard_pool: return
+        self.__shard_pool.close()
+        self.__shard_pool = None
+
+    def __split(self, processes):
+        """
+        Return containers above the first level of at least the number
+        of subtrees, walking down single-child chains, and the subtrees.
+        """
+        trunk, subtrees = [], [self]
+        while len(subtrees) < processes:
+            deeper = [
+                child for container in subtrees
+                for child in container._children if child._children
+            ]
+            if not deeper: break
+            trunk += subtrees
+            subtrees = deeper
+        return trunk, subtrees
+
+    @staticmethod
+    def __shards(subtrees, number):
+        """Split subtrees to balance descendants number of shards."""
+        shards = [[] for _ in range(min(number, len(subtrees)))]
+        sizes = [0] * len(shards)
+        subtree_sizes = {
+            subtree: sum(1 for _ in subtree._descendants) + 1
+            for subtree in subtrees
+        }
+        for subtree in sorted(
+            subtree_sizes, key=subtree_sizes.get, reverse=True
+        ):
+            index = sizes.index(min(sizes))
+            shards[index].append(subtree)
+            sizes[index] += subtree_sizes[subtree]
+        return shards
+
+    def __step_sharded(self, frames, processes):
+        """
+        Step subtrees in the worker processes and the containers above
+        them here for the number of frames, return whether there were
+        enough subtrees. Engines of the workers are kept until the
+        hierarchy changes.
+        """
+        if processes < 2: return False
+        pool = self.__shard_pool
+        if pool and pool.processes != processes: self.close()
+        if not self.__shard_pool:
+            self.__shard_pool = pool = _ShardPool(processes)
+        key = (self._hierarchy_changes, self._time_step, self.sleep_aware)
+        if pool.key != key:
+            trunk, subtrees = self.__split(processes)
+            shards = self.__shards(subtrees, processes) \
+                if len(subtrees) > 1 else []
+            pool.build(self, key, trunk, shards)
+        if not pool.sharded: return False
+        pool.send_steps(frames, self.stepping_policy)
+        for _ in range(frames):
+            for container in pool.trunk:
+                if container._quiescent: continue
+                container._step_b2subworld()
+        pool.receive_states()
+        return True
+
+    def __unsync_shards(self):
+        # stepped here, states of all bodies are sent with the next step
+        if self.__shard_pool: self.__shard_pool.synced = False
+
+    def layout(self):
+        """Return item positions relative to their parents by item id."""
+        store = self._body_store
+        # rows of bodies are kept by their items, all in the hierarchy
+        rows = len(store)
+        return dict(zip(
+            store.ids[:rows].tolist(),
+            map(tuple, store.positions[:rows].tolist()),
+        ))
+
+    def save_layout(self): self._repository.save_layout(self.layout())
+
+
+class _TreeSource(RepositoryBase):
+    """Stand-in for a repository that serves an already loaded tree."""
+
+    def __init__(self, root, tree):
+        super().__init__()
+        self._root = root
+        self.__tree = tree
+
+    def iter_placements(self):
+        for parent_id, items in self.__tree.items():
+            for item in items: yield parent_id, item
+
+    def load_tree(self): return self.__tree
+
+    def shift(self, items, parent): pass
+
+
+def _b2body_state(b2body):
+    return (tuple(b2body.position), tuple(b2body.linearVelocity), b2body.awake)
+
+
+def _set_b2body_state(b2body, position, linear_velocity, awake):
+    b2body.position = position
+    b2body.linearVelocity = linear_velocity
+    b2body.awake = awake
+
+
+def _item_state(item):
+    """Return b2body state, type, bullet flag and drag of the item."""
+    b2body = item._b2body
+    drag = (item._drag_point, item._drag_target) \
+        if item._drag_target else None
+    return (*_b2body_state(b2body), b2body.type, b2body.bullet, drag)
+
+
+def _set_item_state(item, position, velocity, awake, type_, bullet, drag):
+    b2body = item._b2body
+    if b2body.type != type_: b2body.type = type_
+    _set_b2body_state(b2body, position, velocity, awake)
+    if drag:
+        item._start_dragging_b2body(drag[0])
+        item._drag_target = drag[1]
+    else:
+        item._drag_target = None
+    b2body.bullet = bullet
+
+
+class _ShardPool:
+    """
+    Worker processes, each keeping the engine of its shard, subtrees
+    of the hierarchy, from one step to the next.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.__connections = []
+        self.__workers = []
+        for _ in range(processes):
+            connection, worker_connection = Pipe()
+            worker = Process(
+                target=_serve_shard, args=(worker_connection,), daemon=True
+            )
+            worker.start()
+            self.__connections.append(connection)
+            self.__workers.append(worker)
+        # of the hierarchy the engines are built of
+        self.key = None
+        # containers stepped by this process
+        self.trunk = []
+        # connections with the containers with children by id of shards
+        self.__shards = []
+        # whether bodies are as the workers left them, but the woken
+        self.synced = False
+
+    @property
+    def sharded(self): return bool(self.__shards)
+
+    def build(self, engine, key, trunk, shards):
+        """Send the shards of the engine to the workers to build theirs."""
+        self.key, self.trunk = key, trunk
+        self.__shards = []
+        root = ItemData(engine.id, engine.name)
+        for connection, shard in zip(self.__connections, shards):
+            containers, tree, collapsed = {}, {engine.id: shard}, {}
+            for subtree in shard:
+                for container in (subtree, *subtree._descendants):
+                    if container._collapsed:
+                        collapsed[container.id] = container._collapsed
+                    if not container._children: continue
+                    containers[container.id] = container
+                    tree[container.id] = container._children
+            tree = {
+                parent_id: [
+                    ItemData(
+                        child.id,
+                        child.name,
+                        child.product_name,
+                        child.self_mass,
+                        child.self_volume,
+                        tuple(child.position),
+                    ) for child in children
+                ] for parent_id, children in tree.items()
+            }
+            connection.send((
+                'build',
+                root,
+                tree,
+                collapsed,
+                engine._time_step,
+                engine.sleep_aware,
+            ))
+            self.__shards.append((connection, containers))
+        self.synced = False
+
+    def send_steps(self, frames, stepping_policy):
+        """
+        Send the workers states of the children of woken containers,
+        of all if not synced, to step the number of frames.
+        """
+        for connection, containers in self.__shards:
+            states = {}
+            for container in containers.values():
+                if self.synced and container._quiescent: continue
+                # woken again by the changes until the states are received
+                container._quiescent = True
+                states[container.id] = [
+                    _item_state(child) for child in container._children
+                ]
+            connection.send(('step', states, frames, stepping_policy))
+        self.synced = True
+
+    def receive_states(self):
+        """Set states of bodies of the containers the workers stepped."""
+        for connection, containers in self.__shards:
+            for container_id, (quiescent, states) in \
+                    connection.recv().items():
+                container = containers[container_id]
+                for child, state in zip(container._children, states):
+                    _set_b2body_state(child._b2body, *state)
+                container._store_positions()
+                container._quiescent = container._quiescent and quiescent
+
+    def close(self):
+        for connection in self.__connections: connection.send(('close',))
+        for worker in self.__workers: worker.join()
+
+
+class _ShardEngine(PackingEngine):
+    """Steps the subtrees of a shard in a worker process."""
+
+    def __init__(self, root, tree, collapsed, time_step, sleep_aware):
+        super().__init__(_TreeSource(root, tree), time_step)
+        self.sleep_aware = sleep_aware
+        self.stuff()
+        with self._deferred_aggregates():
+            for descendant in list(self._descendants):
+                if descendant.id not in collapsed: continue
+                descendant._collapsed = collapsed[descendant.id]
+                descendant._propagate_aggregates()
+        self.__containers = {
+            container.id: container
+            for container in self._and_childrened_descendants
+            if container is not self
+        }
+
+    def step_shard(self, states, frames, stepping_policy):
+        """
+        Set the states of children of the containers, step for the
+        number of frames, return whether the stepped containers are
+        quiescent and the states of their children by container id.
+        """
+        self.stepping_policy = stepping_policy
+        containers = self.__containers
+        for container_id, children_states in states.items():
+            container = containers[container_id]
+            for child, state in zip(container._children, children_states):
+                _set_item_state(child, *state)
+            container._wake_b2subworld()
+        stepped = {}
+        for _ in range(frames):
+            for container in containers.values():
+                if container._quiescent: continue
+                container._step_b2subworld()
+                stepped[container.id] = container
+        stepped_states = {}
+        for container_id, container in stepped.items():
+            b2bodies = [child._b2body for child in container._children]
+            stepped_states[container_id] = (
+                container._quiescent, list(map(_b2body_state, b2bodies))
+            )
+        return stepped_states
+
+
+def _serve_shard(connection):
+    """Build and step the engine of a shard on requests of connection."""
+    engine: _ShardEngine = None
+    while True:
+        request, *args = connection.recv()
+        if request == 'build':
+            engine = _ShardEngine(*args)
+        elif request == 'step':
+            connection.send(engine.step_shard(*args))
+        else:
+            break
+    connection.close()
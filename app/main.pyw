@@ -1,7 +1,12 @@
 #! python3.7
+import os
+import sys
+
 from PyQt5.QtWidgets import QApplication, QMainWindow, QGraphicsView
 
 from repository import Repository
+from repository_files import DirectoryRepository
+from repository_json import JsonRepository
 from model import Model
 from _ctrl import Ctrl_MainWindow, Ctrl_GraphicsView
 from _ui import Ui_MainWindow, Ui_GraphicsView
@@ -27,12 +32,22 @@ class MainWindow(Ctrl_MainWindow, QMainWindow, Ui_MainWindow):
         model._q_scene.hovered.connect(self.updateStatusBar)
 
 
+def open_repository(path):
+    """Return the repository backend for the database, file or directory."""
+    if os.path.isdir(path): return DirectoryRepository(path)
+    if path.endswith(('.json', '.ndjson', '.jsonl')):
+        return JsonRepository(path)
+    return Repository(path)
+
+
 app = QApplication([])
-repository = Repository('../sample.db')
+path = sys.argv[1] if len(sys.argv) > 1 else '../sample.db'
+repository = open_repository(path)
 model = Model(repository, target_fps=30.0385)
 window = MainWindow(model)
 model.start()
 window.showMaximized()
 model.stuff()  # 15–18% CPU
+model._q_scene.updateLevelOfDetail()
 app.exec()
 model.quit()
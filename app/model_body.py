@@ -1,19 +1,35 @@
 from math import pi, sqrt, sin, cos, hypot, atan2
+from operator import methodcaller
 from random import random
+from time import perf_counter
 
+import numpy as np
 from Box2D import b2World, b2Body, b2_staticBody, b2_dynamicBody
-from PyQt5.QtCore import QTimer
 
-from utilities.geometry import outersected
+from utilities.geometry import outersected_array, pack_circles
+from utilities.profiling import Profiler
+from utilities.stepping import SteppingPolicy
+from utilities.store import ColumnStore
 
 
 _ZERO_VECTOR = (0.0, 0.0)
+# steps of the subworld between measurements of its kinetic energy
+_STEPS_PER_PLAN = 8
 
 
 class _BodyBase:
 
+    __slots__ = ()
+    # attributes for slots of the leaf classes, see utilities.slots
+    _SLOTS = ('_b2body', '_row')
+
     def __init__(self):
         self._b2body: b2Body = None
+        # of the body in the body store of the model
+        self._row: int = None
+
+    @property
+    def __store(self): return self._model._body_store
 
     @property
     def __fixture(self): return self._b2body.fixtures[0]
@@ -38,12 +54,18 @@ class _BodyBase:
     # density-area option is needed when the body is static (pinched)
 
     @_mass.setter
-    def _mass(self, mass): self.__density = mass / self._area
+    def _mass(self, mass):
+        self.__density = mass / self._area
+        self.__store.masses[self._row] = mass
 
     @property
     def position(self): return self._b2body.position
+
     @position.setter
-    def position(self, position): self._b2body.position = position
+    def position(self, position):
+        self._b2body.position = position
+        # rounded as by the body
+        self.__store.positions[self._row] = self._b2body.position.tuple
 
     @property
     def radius(self): return self.__shape.radius
@@ -53,24 +75,39 @@ class _BodyBase:
         mass = self._mass
         self.__shape.radius = radius
         self.__density = mass / self._area
+        self.__store.radii[self._row] = self.__shape.radius
+
+    def _set_total_mass_and_area(self, mass, area):
+        """Resize the body and set its mass with one mass data reset."""
+        shape = self.__shape
+        shape.radius = sqrt(area/pi)
+        self.__density = mass / area
+        store = self.__store
+        store.radii[self._row], store.masses[self._row] = shape.radius, mass
 
 
 class _InteractiveBodyMixin:
 
+    __slots__ = ()
+    _SLOTS = ('__last_velocity', '__drag_point', '_drag_target')
+
     def __init__(self):
         self.__last_velocity = _ZERO_VECTOR
         self.__drag_point = _ZERO_VECTOR
         self._drag_target = None
 
     def _pinch_b2body(self):
+        self._wake_b2superworlds()
         self.__last_velocity = self._b2body.linearVelocity.copy()
         self._b2body.type = b2_staticBody
 
     def _release_b2body(self):
+        self._wake_b2superworlds()
         self._b2body.type = b2_dynamicBody
         self._b2body.linearVelocity = self.__last_velocity
 
     def _release_b2body_calmly(self):
+        self._wake_b2superworlds()
         self._b2body.type = b2_dynamicBody
 
     def _start_dragging_b2body(self, drag_point):
@@ -81,10 +118,12 @@ class _InteractiveBodyMixin:
         self._drag_target = drag_target
         self._release_b2body_calmly()
 
-    def _finish_dragging_b2body(self):
-        self._drag_target = None
-        def set_bullet_to_false(): self._b2body.bullet = False
-        QTimer.singleShot(3000, set_bullet_to_false)
+    @property
+    def _drag_point(self): return self.__drag_point
+
+    def _finish_dragging_b2body(self): self._drag_target = None
+
+    def _stop_bullet_b2body(self): self._b2body.bullet = False
 
     def drag_b2body(self):
         factor = -10.0 / self._total_mass  # real inertia
@@ -99,19 +138,24 @@ class _InteractiveBodyMixin:
 
 class BodyContainerMixin(_InteractiveBodyMixin, _BodyBase):
 
+    __slots__ = ()
+    _SLOTS = (
+        '__b2subworld', '_time_step', '_quiescent',
+        '__b2children_cache', '__step_plan', '__steps_planned',
+    )
+
     def __init__(self, time_step):
         _InteractiveBodyMixin.__init__(self)
         _BodyBase.__init__(self)
         self.__b2subworld: b2World = None
         self._time_step = time_step
-
-    def __rake_in(self, outersected_):
-        radius = self.radius
-        position = self.position
-        factor = -3000.0*outersected_ * radius*radius / position.length
-        force = [pos*factor for pos in position]
-        # point = (0.0, 0.0)  # TODO: touchpoint
-        self._b2body.ApplyForce(force=force, point=_ZERO_VECTOR, wake=False)
+        # all bodies of subworld are asleep, so it may not be stepped
+        self._quiescent = False
+        # children b2bodies and radii for the vectorized step
+        self.__b2children_cache = None
+        # iterations and substeps by the stepping policy
+        self.__step_plan = None
+        self.__steps_planned = 0
 
     @property
     def _total_mass(self): return self._mass
@@ -126,10 +170,12 @@ class BodyContainerMixin(_InteractiveBodyMixin, _BodyBase):
         self._parent.__b2subworld.DestroyBody(self._b2body)
         self._b2body = None
 
-    def _create_b2body(self):
+    def _create_b2body(self, awake=True):
         if self._b2body:
             mass, area = self._total_mass, self._area
             self._model.queue_to_destroy(self)
+        elif self._collapsed:
+            mass, area = self._collapsed
         else:
             mass, area = self.self_mass, self.self_volume
         b2body = self._parent.__b2subworld.CreateDynamicBody()
@@ -142,11 +188,26 @@ class BodyContainerMixin(_InteractiveBodyMixin, _BodyBase):
         b2body.linearDamping = 1.0
         b2body.angularDamping = 1.0
         b2body.userData = self
+        b2body.awake = awake
         self._b2body = b2body
+        store = self._model._body_store
+        if self._row is None:
+            self._row = store.add_row(ids=self.id, items=self)
+        row = self._row
+        store.radii[row] = b2body.fixtures[0].shape.radius
+        store.masses[row] = mass
+        store.positions[row] = _ZERO_VECTOR  # of the new body
 
     def _awake_b2bodies(self):
         for b2body in self.__b2subworld.bodies:
             b2body.awake = True
+        self._quiescent = False
+
+    def _wake_b2subworld(self): self._quiescent = False
+
+    def _wake_b2superworlds(self):
+        for ancestor in self._ancestors:
+            ancestor._quiescent = False
 
     def _throw_in(self, children, target=None):
         target = target or _ZERO_VECTOR
@@ -173,20 +234,127 @@ class BodyContainerMixin(_InteractiveBodyMixin, _BodyBase):
             child.position = start
             child._b2body.linearVelocity = velocity
 
+    def _place_in(self, children):
+        for child in children: child.position = child.saved_position
+        # awake, as the layout may be saved unsettled: settled bodies
+        # fall asleep again by themselves, others get their contacts
+        for child in children: child._b2body.awake = True
+
+    def _pack_in(self):
+        """Seed children positions by analytic circle packing."""
+        centers = pack_circles([child.radius for child in self._children])
+        for child, center in zip(self._children, centers):
+            child.position = center
+            child._b2body.linearVelocity = _ZERO_VECTOR
+        for child in self._children: child._b2body.awake = True
+        self._wake_b2subworld()
+
+    def _reset_b2children_cache(self): self.__b2children_cache = None
+
+    def _b2subworld_counts(self):
+        """
+        Return numbers of awake children bodies and of contacts,
+        including the ones of only overlapping bounding boxes.
+        """
+        b2bodies = self.__b2children[0]
+        awake_bodies = sum(b2body.awake for b2body in b2bodies)
+        return awake_bodies, self.__b2subworld.contactCount
+
+    @property
+    def __b2children(self):
+        """Return children b2bodies and their rows in the body store."""
+        if not self.__b2children_cache:
+            b2bodies = [child._b2body for child in self._children]
+            rows = np.array([child._row for child in self._children], int)
+            self.__b2children_cache = (b2bodies, rows)
+        return self.__b2children_cache
+
+    def _store_positions(self):
+        """Copy positions of children bodies to the body store."""
+        b2bodies, rows = self.__b2children
+        # none yet, when the subworld is stepped before they are added
+        if not b2bodies: return
+        positions = [b2body.position for b2body in b2bodies]
+        positions = [(position.x, position.y) for position in positions]
+        store = self._model._body_store
+        with store.lock: store.positions[rows] = positions
+
+    def __kinetic_energy(self):
+        """Return kinetic energy and total mass of children bodies."""
+        b2bodies, rows = self.__b2children
+        masses = self._model._body_store.masses[rows]
+        squared_speeds = np.fromiter(
+            (b2body.linearVelocity.lengthSquared for b2body in b2bodies),
+            float,
+            len(b2bodies),
+        )
+        return 0.5*masses.dot(squared_speeds), masses.sum()
+
+    def __rake_in_children(self, parent_radius):
+        b2bodies, rows = self.__b2children
+        store = self._model._body_store
+        positions, radii = store.positions[rows], store.radii[rows]
+        distances = np.hypot(positions[:, 0], positions[:, 1])
+        outersected_ = outersected_array(radii, parent_radius, distances)
+        # bodies in the very center have no direction to be raked in
+        raked = np.flatnonzero(outersected_ * distances)
+        if not raked.size: return
+        radii, distances = radii[raked], distances[raked]
+        factors = -3000.0*outersected_[raked] * radii*radii / distances
+        forces = positions[raked] * factors[:, np.newaxis]
+        for index, force in zip(raked.tolist(), forces.tolist()):
+            # point = (0.0, 0.0)  # TODO: touchpoint
+            b2bodies[index].ApplyForce(
+                force=force, point=_ZERO_VECTOR, wake=False
+            )
+
+    def __apply_forces(self, parent_radius):
+        """Rake in and drag children, return whether any is dragged."""
+        dragged = False
+        self.__rake_in_children(parent_radius)
+        for child in self._children:
+            if child._drag_target:
+                child.drag_b2body()
+                dragged = True
+        return dragged
+
+    def __plan_step(self, policy, parent_radius, dragged):
+        """Plan the step by the kinetic energy measured every few steps."""
+        if dragged:
+            self.__step_plan = None
+            return policy.plan(0.0, 0.0, parent_radius, dragged)
+        if self.__step_plan and self.__steps_planned < _STEPS_PER_PLAN:
+            self.__steps_planned += 1
+            return self.__step_plan
+        self.__step_plan = \
+            policy.plan(*self.__kinetic_energy(), parent_radius)
+        self.__steps_planned = 1
+        return self.__step_plan
+
     def _step_b2subworld(self):
         parent_radius = self.radius
         # parent_radius = self._b2body.fixtures[0].shape.radius
-        for child in self._children:
-            b2body = child._b2body
-            outersected_ = outersected(
-                b2body.fixtures[0].shape.radius,  # child.radius,
-                parent_radius,
-                b2body.position.length,  # child.position.length,
-            )
-            if outersected_: child.__rake_in(outersected_)
-            if child._drag_target: child.drag_b2body()
-        self.__b2subworld.Step(self._time_step, 10, 10)
-        self.__b2subworld.ClearForces()
+        dragged = self.__apply_forces(parent_radius)
+        b2subworld = self.__b2subworld
+        policy = self._model.stepping_policy
+        if policy is None:
+            b2subworld.Step(self._time_step, 10, 10)
+            b2subworld.ClearForces()
+            self._store_positions()
+        else:
+            velocity_iterations, position_iterations, substeps = \
+                self.__plan_step(policy, parent_radius, dragged)
+            time_step = self._time_step / substeps
+            for substep in range(substeps):
+                if substep: self.__apply_forces(parent_radius)
+                b2subworld.Step(
+                    time_step, velocity_iterations, position_iterations
+                )
+                b2subworld.ClearForces()
+                self._store_positions()
+        if self._model.sleep_aware:
+            self._quiescent = \
+                not any(b2body.awake for b2body in b2subworld.bodies)
 
     def _step_b2subworlds(self):
         '''
@@ -195,8 +363,12 @@ class BodyContainerMixin(_InteractiveBodyMixin, _BodyBase):
             child._step_b2subworlds()
         self._step_b2subworld()
         '''
-        for item in self._and_childrened_descendants:
-            item._step_b2subworld()
+        # the tuple protects from changes of hierarchy in the GUI thread
+        items = tuple(self._and_childrened_descendants)
+        step = self._subworld_stepper()
+        for item in items:
+            if item._quiescent: continue
+            step(item)
 
     def _step_b2superworld(self): self._parent._step_b2subworld()
 
@@ -221,12 +393,73 @@ class BodyHierarchyMixin:
         self._area = self.self_volume
         self._total_mass = self.self_mass
         self._b2bodies_to_destroy = []
+        # ordered set of self if it has children + descendants with children
+        # needed for a significant increase in performance in the main loop
+        self._and_childrened_descendants = {}
+        self.__sleep_aware = True
+        self.__gentle_cursor = 0
+        # seconds per frame for stepping of subworlds out of focus
+        self.gentle_budget = 0.005
+        # solver iterations and substeps, None for the fixed ones
+        self.stepping_policy: SteppingPolicy = None
+        self.profiler = Profiler()
+        # items, their ids, radii, masses and body positions by rows
+        self._body_store = store = ColumnStore()
+        store.add_column('items', object, fill=None)
+        store.add_column('ids', int)
+        store.add_column('radii')
+        store.add_column('masses')
+        store.add_column('positions', width=2)
 
     @property
     def _total_mass(self): return self.__total_mass
     @_total_mass.setter
     def _total_mass(self, mass): self.__total_mass = mass
 
+    def _step_b2subworlds_gently(self, focus=None, budget=None):
+        """
+        Step the focus subworld and its superworlds, then step the rest
+        round-robin while the time budget lasts.
+        """
+        deadline = perf_counter() + (budget or self.gentle_budget)
+        step = self._subworld_stepper()
+        focus = focus or self
+        if focus._children and not focus._quiescent: step(focus)
+        for ancestor in focus._ancestors:
+            if ancestor._quiescent: continue
+            step(ancestor)
+        focused = (focus, *focus._ancestors)
+        items = tuple(self._and_childrened_descendants)
+        items_len = len(items)
+        cursor = self.__gentle_cursor
+        for _ in range(items_len):
+            if perf_counter() >= deadline: break
+            item = items[cursor % items_len]
+            cursor += 1
+            if item._quiescent or item in focused: continue
+            step(item)
+        self.__gentle_cursor = cursor % items_len if items_len else 0
+
+    def _subworld_stepper(self):
+        """
+        Return the function stepping the subworld of an item, which also
+        records it if the profiler is enabled.
+        """
+        profiler = self.profiler
+        if not profiler.enabled: return methodcaller('_step_b2subworld')
+        record_subworld = profiler.record_subworld
+
+        def step_recorded(item):
+            start = perf_counter()
+            item._step_b2subworld()
+            record_subworld(
+                item.id,
+                start,
+                perf_counter() - start,
+                *item._b2subworld_counts(),
+            )
+        return step_recorded
+
     def _destroy_b2bodies_to_destroy(self):
         for b2body in self._b2bodies_to_destroy:
             b2body.world.DestroyBody(b2body)
@@ -240,6 +473,17 @@ class BodyHierarchyMixin:
         for self_or_descendant in (self, *self._descendants):
             self_or_descendant._time_step = time_step
 
+    @property
+    def sleep_aware(self):
+        """Whether subworlds with all bodies asleep are skipped."""
+        return self.__sleep_aware
+
+    @sleep_aware.setter
+    def sleep_aware(self, sleep_aware):
+        self.__sleep_aware = sleep_aware
+        for item in self._and_childrened_descendants:
+            item._wake_b2subworld()
+
     @property
     def position(self): return _ZERO_VECTOR
 
@@ -248,5 +492,9 @@ class BodyHierarchyMixin:
     @radius.setter
     def radius(self, radius): self.__radius = radius
 
+    def _set_total_mass_and_area(self, mass, area):
+        self.__total_mass = mass
+        self.__radius = sqrt(area/pi)
+
     def queue_to_destroy(self, item):
         self._b2bodies_to_destroy.append(item._b2body)
@@ -1,9 +1,19 @@
+from contextlib import contextmanager
+from itertools import compress
+
+import numpy as np
+from PyQt5.QtCore import QRectF
 from PyQt5.QtWidgets import QGraphicsEllipseItem, QGraphicsScene
 
 from _ctrl import Ctrl_GraphicsItem, Ctrl_GraphicsScene
 from _ui import Ui_GraphicsItem, Ui_InteractiveGraphics, Ui_GraphicsScene
 
 
+# movement in scene pixels that is not worth repainting
+_MOVE_THRESHOLD = 0.1
+_NOWHERE = (float('inf'), float('inf'))
+
+
 class _Circle(
     Ctrl_GraphicsItem,
     QGraphicsEllipseItem,
@@ -43,16 +53,77 @@ class _Scene(Ctrl_GraphicsScene, QGraphicsScene, Ui_GraphicsScene):
         Ui_GraphicsScene.__init__(self)
         Ctrl_GraphicsScene.__init__(self)
         self._model = model
+        self.__zoom = 1.0
 
     def addItem(self, item):
         super().addItem(item)
         item.adoptScale()
 
+    def setZoom(self, zoom):
+        self.__zoom = zoom
+        self.updateLevelOfDetail()
+
+    def updateLevelOfDetail(self, container=None):
+        """
+        Show only the items not smaller than LOD radius in the view,
+        expand the collapsed ones larger than expand radius in sight.
+        """
+        zoom_scale = self.scale * self.__zoom
+        self.__updateLevelOfDetail(
+            container or self._model,
+            self.lodRadius / zoom_scale,
+            self.expandRadius / zoom_scale,
+            self.__sight(),
+        )
+
+    def __updateLevelOfDetail(
+        self, container, min_radius, expand_radius, sight
+    ):
+        for child in container._children:
+            if child.radius >= min_radius:
+                if not child._q_shown:
+                    child._q_shown = True
+                    child._q_item.show()
+                    child.move_q_item()
+                expanding = \
+                    child._collapsed and child.radius >= expand_radius
+                if expanding and \
+                        sight.intersects(child._q_item.sceneBoundingRect()):
+                    # which updates the level of detail of its children
+                    self._model.expand(child)
+                elif child._children:
+                    self.__updateLevelOfDetail(
+                        child, min_radius, expand_radius, sight
+                    )
+            elif child._q_shown:
+                self.__hide(child)
+
+    def __sight(self):
+        """Return the scene rectangle in the view, empty without one."""
+        views = self.views()
+        if not views: return QRectF()
+        view = views[0]
+        return view.mapToScene(view.viewport().rect()).boundingRect()
+
+    def __hide(self, item):
+        item._q_shown = False
+        item._q_item.hide()
+        for child in item._children:
+            if child._q_shown: self.__hide(child)
+
 
 class GraphicsContainerMixin:
 
+    __slots__ = ()
+    _SLOTS = (
+        '_q_item', '_q_shown',
+        '__weakref__',  # for bound methods as Qt slots
+    )
+
     def __init__(self):
         self._q_item: _Circle = None
+        # item and its ancestors are not hidden by level of detail
+        self._q_shown = True
 
     def _create_q_item(self):
         if self._parent.is_root:
@@ -65,7 +136,10 @@ class GraphicsContainerMixin:
         parent_q_item = None if self._parent.is_root else self._parent._q_item
         self._q_item.setParentItem(parent_q_item)
 
-    def move_q_item(self): self._q_item.setPos(*self.position)
+    def move_q_item(self):
+        position = tuple(self.position)
+        self._model._body_store.q_positions[self._row] = position
+        self._q_item.setPos(*position)
     '''
     def _move_q_items(self):
         for child in self._children:
@@ -78,6 +152,48 @@ class GraphicsHierarchyMixin:
 
     def __init__(self):
         self._q_scene = _Scene(self)
-
-    def _move_q_items(self):
-        for descendant in self._descendants: descendant.move_q_item()
+        self.__move_threshold = _MOVE_THRESHOLD / self._q_scene.scale
+        # positions of the bodies when their items were last moved
+        self._body_store.add_column('q_positions', width=2, fill=_NOWHERE)
+        # containers to update level of detail by the end of bulk operation
+        self.__expanded = []
+
+    @contextmanager
+    def _deferred_aggregates(self):
+        outermost = self._dirty_aggregates is None
+        with super()._deferred_aggregates(): yield
+        if not outermost: return
+        # once radii of their new descendants are final
+        expanded, self.__expanded = self.__expanded, []
+        for container in expanded:
+            if container._q_shown:
+                self._q_scene.updateLevelOfDetail(container)
+
+    def expand(self, container):
+        """Stuff the collapsed container, showing the children in detail."""
+        if container._collapsed: self.__expanded.append(container)
+        super().expand(container)
+
+    def _moved_q_items(self):
+        """Return items moved since last update and their positions."""
+        threshold = self.__move_threshold
+        store = self._body_store
+        length = len(store)
+        # after the length, as the store may have grown
+        positions = store.positions[:length]
+        shifts = np.abs(positions - store.q_positions[:length])
+        rows = np.flatnonzero(shifts.max(axis=1) >= threshold)
+        items = store.items[rows].tolist()
+        shown = [item._q_shown for item in items]
+        rows = rows[shown]
+        positions = positions[rows]
+        with store.lock: store.q_positions[rows] = positions
+        return list(compress(items, shown)), positions
+
+    def _move_q_items(self, moved):
+        profiler = self.profiler
+        profiler.signal_received('updated')
+        items, positions = moved
+        with profiler.phase('move_q_items'):
+            for item, position in zip(items, positions.tolist()):
+                item._q_item.setPos(*position)
@@ -1,6 +1,54 @@
 import sqlite3
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from threading import Condition, Thread
 from math import pi
 from dataclasses import dataclass, field
+from typing import Tuple
+
+
+_DEFAULT_SELF_MASS = 1.0
+_DEFAULT_SELF_VOLUME = 4 / 3 * pi * (0.1)**3
+
+# schema changes by version, applied in order to older databases
+_MIGRATIONS = (
+    # 1: saved layouts
+    """
+    CREATE TABLE IF NOT EXISTS layout (
+        arrangement_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        x REAL NOT NULL,
+        y REAL NOT NULL,
+        PRIMARY KEY(arrangement_id, item_id),
+        FOREIGN KEY(arrangement_id) REFERENCES arrangement(arrangement_id),
+        FOREIGN KEY(item_id) REFERENCES item(item_id)
+    );
+    """,
+    # 2: the same item in several arrangements, indexed lookups
+    """
+    CREATE TABLE placement_2 (
+        placement_id INTEGER NOT NULL UNIQUE,
+        arrangement_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        parent_id INTEGER,
+        FOREIGN KEY(item_id) REFERENCES item(item_id),
+        FOREIGN KEY(parent_id) REFERENCES item(item_id),
+        FOREIGN KEY(arrangement_id) REFERENCES arrangement(arrangement_id),
+        PRIMARY KEY(placement_id AUTOINCREMENT),
+        UNIQUE(arrangement_id, item_id)
+    );
+    INSERT INTO placement_2 (placement_id, arrangement_id, item_id, parent_id)
+    SELECT placement_id, arrangement_id, item_id, parent_id FROM placement;
+    DROP TABLE placement;
+    ALTER TABLE placement_2 RENAME TO placement;
+    CREATE INDEX placement_parent ON placement(arrangement_id, parent_id);
+    """,
+    # 3: own mass and volume of items, null for the default ones
+    """
+    ALTER TABLE item ADD COLUMN self_mass REAL;
+    ALTER TABLE item ADD COLUMN self_volume REAL;
+    """,
+)
 
 
 @dataclass
@@ -14,17 +62,23 @@ class _ItemDataBase:
 
 @dataclass
 class _PhysicalItemData:
-    self_mass: float = 1.0
-    self_volume: float = 4 / 3 * pi * (0.1)**3
+    self_mass: float = _DEFAULT_SELF_MASS
+    self_volume: float = _DEFAULT_SELF_VOLUME
+
+
+@dataclass
+class _LayoutItemData:
+    # position relative to parent when the layout was saved
+    saved_position: Tuple[float, float] = None
 
 
 @dataclass
-class ItemData(_PhysicalItemData, _ItemDataBase):
+class ItemData(_LayoutItemData, _PhysicalItemData, _ItemDataBase):
     """Represents data transfer objects (DTO). Contains only database data."""
 
     def __post_init__(self):
         self.product_name = self.product_name or ''
-        self.is_root = (self.id == Repository.root_id)
+        self.is_root = (self.id == RepositoryBase.root_id)
 
     def __hash__(self): return self.id
 
@@ -32,19 +86,78 @@ class ItemData(_PhysicalItemData, _ItemDataBase):
         return isinstance(other, self.__class__) and self.id == other.id
 
 
-class Repository:
-    """Represents data access object (DAO)."""
+class RepositoryBase(ABC):
+    """
+    Represents hierarchical data source. Backends stream item placements
+    and move items between parents in batches.
+    """
 
     default_arrangement = 'current'
     root_id = 0
     root_name = 'root'
 
+    def __init__(self):
+        self._root = ItemData(self.root_id, self.root_name)
+
+    @property
+    def arrangement(self): return self.default_arrangement
+
+    @abstractmethod
+    def iter_placements(self):
+        """
+        Yield parent id and data of every item, where root children
+        have root_id as the parent id.
+        """
+
+    def children_of(self, item):
+        return [
+            child for parent_id, child in self.iter_placements()
+            if parent_id == item.id
+        ]
+
+    def load_tree(self):
+        """Return all children of the arrangement grouped by parent id."""
+        tree = defaultdict(list)
+        for parent_id, item in self.iter_placements():
+            tree[parent_id].append(item)
+        return tree
+
+    @abstractmethod
+    def shift(self, items, parent):
+        """Move the items into the parent."""
+
+    def flush(self):
+        """Block until all shifts are stored."""
+
+    def save_layout(self, positions):
+        """Save item positions relative to their parents by item id."""
+
+
+class Repository(RepositoryBase):
+    """Represents data access object (DAO) of SQLite database."""
+
+    # seconds for shifts to coalesce before they are committed together
+    write_delay = 0.5
+
     def __init__(self, filename):
-        self.__connect = sqlite3.connect(filename)
+        super().__init__()
+        self.__filename = filename
+        # closed by __del__ in the thread dropping the last reference,
+        # which may be the writer, holding one until it ends
+        self.__connect = sqlite3.connect(filename, check_same_thread=False)
         self.__cursor = self.__connect.cursor()
+        # readers and the background writer do not block each other
+        self.__cursor.execute("PRAGMA journal_mode=WAL")
+        self.__migrate()
         self.__arrangement_id: int
-        self._root = ItemData(self.root_id, self.root_name)
         self.arrangement = self.default_arrangement
+        # parent ids to write by arrangement and item ids
+        self.__shifts = {}
+        self.__shifts_condition = Condition()
+        self.__writer: Thread = None
+        self.__flushing = False
+        # of the last failed commit, raised by flush
+        self.__write_error: sqlite3.Error = None
 
     def __del__(self):
         self.__cursor.close()
@@ -71,24 +184,139 @@ class Repository:
         if not response: raise ValueError
         self.__arrangement_id = response[0]
 
+    @staticmethod
+    def __item_data(item_id, name, product_name, self_mass, self_volume):
+        item = ItemData(item_id, name, product_name)
+        # null means the default
+        if self_mass is not None: item.self_mass = self_mass
+        if self_volume is not None: item.self_volume = self_volume
+        return item
+
     def children_of(self, item):
         request = """
-            SELECT item_id, name, product_name
+            SELECT item_id, name, product_name, self_mass, self_volume
             FROM placement LEFT JOIN item USING(item_id)
-            WHERE parent_id IS ? AND arrangement_id IS ?
+            WHERE arrangement_id IS ? AND parent_id IS ?
             """
-        data = (item.id or None, self.__arrangement_id)
+        data = (self.__arrangement_id, item.id or None)
         self.__cursor.execute(request, data)
         response = self.__cursor.fetchall()
-        return [ItemData(*fields) for fields in response]
+        return [self.__item_data(*fields) for fields in response]
+
+    def iter_placements(self):
+        request = """
+            SELECT
+                parent_id, item_id, name, product_name,
+                self_mass, self_volume, x, y
+            FROM placement
+                LEFT JOIN item USING(item_id)
+                LEFT JOIN layout USING(arrangement_id, item_id)
+            WHERE arrangement_id IS ?
+            """
+        data = (self.__arrangement_id,)
+        # own cursor not to be reset by other requests while streaming
+        for parent_id, *fields, x, y in \
+                self.__connect.execute(request, data):
+            item = self.__item_data(*fields)
+            if x is not None: item.saved_position = (x, y)
+            yield parent_id or self.root_id, item
 
     def shift(self, items, parent):
-        id_placeholdels = ','.join('?' * len(items))
+        """Queue items moving into the parent to commit in the background."""
+        parent_id = parent.id or None
+        with self.__shifts_condition:
+            for item in items:
+                self.__shifts[self.__arrangement_id, item.id] = parent_id
+            self.__start_writer()
+
+    def __start_writer(self):
+        if self.__writer: return
+        self.__writer = Thread(target=self.__write_behind, daemon=True)
+        self.__writer.start()
+
+    def flush(self):
+        """
+        Block until all queued shifts are committed, retrying the ones
+        of a failed commit; raise the error if they fail again.
+        """
+        condition = self.__shifts_condition
+        with condition:
+            self.__write_error = None
+            if self.__shifts: self.__start_writer()
+            if self.__writer:
+                self.__flushing = True
+                condition.notify_all()
+                condition.wait_for(lambda: self.__writer is None)
+                self.__flushing = False
+            error, self.__write_error = self.__write_error, None
+        if error: raise error
+
+    def __write_behind(self):
+        """Commit queued shifts in batches until there are no more."""
+        condition = self.__shifts_condition
+        connect = sqlite3.connect(self.__filename)
+        try:
+            while True:
+                with condition:
+                    condition.wait_for(
+                        lambda: self.__flushing, self.write_delay
+                    )
+                    shifts, self.__shifts = self.__shifts, {}
+                    if not shifts:
+                        self.__writer = None
+                        condition.notify_all()
+                        return
+                try:
+                    self.__commit_shifts(connect, shifts)
+                except sqlite3.Error as error:
+                    with condition:
+                        # back to the queue, behind the newer shifts
+                        for key, parent_id in shifts.items():
+                            self.__shifts.setdefault(key, parent_id)
+                        self.__write_error = error
+                    return
+        finally:
+            connect.close()
+            with condition:
+                if self.__writer is not None:  # on error, next shift restarts
+                    self.__writer = None
+                    condition.notify_all()
+
+    @staticmethod
+    def __commit_shifts(connect, shifts):
         request = """
             UPDATE placement SET parent_id = ?
-            WHERE item_id IN ({0}) AND arrangement_id IS ?
-            """.format(id_placeholdels)
-        item_ids = [item.id for item in items]
-        data = (parent.id or None, *item_ids, self.__arrangement_id)
-        self.__cursor.execute(request, data)
+            WHERE arrangement_id IS ? AND item_id IS ?
+            """
+        data = [
+            (parent_id, arrangement_id, item_id)
+            for (arrangement_id, item_id), parent_id in shifts.items()
+        ]
+        with connect: connect.executemany(request, data)
+
+    def __migrate(self):
+        """Bring the database schema up to the current version."""
+        self.__cursor.execute("PRAGMA user_version")
+        version = self.__cursor.fetchone()[0]
+        if version > len(_MIGRATIONS):
+            raise ValueError(f'unsupported schema version {version}')
+        for version, script in enumerate(_MIGRATIONS[version:], version+1):
+            self.__cursor.executescript(f"""
+                BEGIN;
+                {script}
+                PRAGMA user_version = {version};
+                COMMIT;
+                """)
+
+    def save_layout(self, positions):
+        """Save item positions relative to their parents by item id."""
+        request = """
+            INSERT OR REPLACE INTO layout (arrangement_id, item_id, x, y)
+            VALUES (?, ?, ?, ?)
+            """
+        data = [
+            (self.__arrangement_id, item_id, x, y)
+            for item_id, (x, y) in positions.items()
+        ]
+        self.__cursor.executemany(request, data)
         self.__connect.commit()
@@ -0,0 +1,56 @@
+import os
+from itertools import count
+from operator import attrgetter
+
+from repository import ItemData, RepositoryBase
+
+
+class DirectoryRepository(RepositoryBase):
+    """
+    Represents files and subdirectories of the directory as items,
+    with file sizes as self volumes. Items are numbered in order
+    of the walk. Shifts are kept in memory only, files are never moved.
+    """
+
+    # a megabyte file is as large as the default item
+    volume_per_byte = ItemData.self_volume / 1e6
+    # not to be too small for the physics
+    min_self_volume = ItemData.self_volume / 100
+
+    def __init__(self, path):
+        super().__init__()
+        self.__path = path
+        self._root.name = os.path.basename(os.path.abspath(path))
+        self.__shifts = {}  # parent ids by item ids
+
+    def iter_placements(self):
+        shifts = self.__shifts
+        ids = count(1)
+        stack = [(self.root_id, self.__path)]
+        while stack:
+            parent_id, path = stack.pop()
+            try:
+                entries = sorted(os.scandir(path), key=attrgetter('name'))
+            except OSError:
+                continue  # not readable
+            for entry in entries:
+                item_id = next(ids)
+                if entry.is_dir(follow_symlinks=False):
+                    item = ItemData(item_id, entry.name)
+                    stack.append((item_id, entry.path))
+                else:
+                    item = self.__file_item(item_id, entry)
+                yield shifts.get(item_id, parent_id), item
+
+    def __file_item(self, item_id, entry):
+        try:
+            size = entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            size = 0
+        volume = max(size*self.volume_per_byte, self.min_self_volume)
+        # of the same density as the default item
+        mass = volume / ItemData.self_volume * ItemData.self_mass
+        return ItemData(item_id, entry.name, '', mass, volume)
+
+    def shift(self, items, parent):
+        for item in items: self.__shifts[item.id] = parent.id
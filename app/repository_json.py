@@ -0,0 +1,155 @@
+import json
+import os
+from itertools import count
+
+from repository import ItemData, RepositoryBase
+
+
+_OPTIONAL_FIELDS = ('self_mass', 'self_volume')
+
+
+def _item_data(record, item_id):
+    item = ItemData(
+        item_id,
+        record['name'],
+        record.get('product_name') or '',
+        **{
+            key: record[key] for key in _OPTIONAL_FIELDS
+            if record.get(key) is not None
+        }
+    )
+    if record.get('x') is not None:
+        item.saved_position = (record['x'], record['y'])
+    return item
+
+
+class JsonRepository(RepositoryBase):
+    """
+    Represents data access object of JSON file with nested objects
+    {"name": ..., "children": [...]}, where the top object is the root
+    or the top list is of root children, or of NDJSON (.ndjson, .jsonl)
+    file with objects {"id": ..., "parent_id": ..., "name": ...}, one
+    per line, where root children have null parent id.
+
+    Optional keys are "id", "product_name", "self_mass", "self_volume"
+    and "x", "y" of the saved position. Nested objects without ids
+    are numbered in order of appearance, following the largest given
+    id. Shifts are written back to the file on flush, with the ids.
+    Layouts are kept in the list of [id, x, y] of the sidecar file
+    with the ".layout" suffix, so the file is not changed by them.
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self.__filename = filename
+        self.__layout_filename = filename + '.layout'
+        self.__flat = filename.endswith(('.ndjson', '.jsonl'))
+        self.__shifts = {}  # parent ids by item ids
+        self.__positions = {}
+
+    def iter_placements(self):
+        shifts = self.__shifts
+        positions = self.__load_layout()
+        positions.update(self.__positions)
+        if self.__flat:
+            placements = self.__iter_flat()
+        else:
+            placements = self.__iter_nested(self.__load())
+        for parent_id, record, item_id in placements:
+            if item_id == self.root_id:
+                raise ValueError(f'item id {item_id} is the root id')
+            item = _item_data(record, item_id)
+            position = positions.get(item_id)
+            if position: item.saved_position = position
+            yield shifts.get(item_id, parent_id), item
+
+    def __iter_flat(self):
+        with open(self.__filename, encoding='utf-8') as file:
+            for line in file:
+                if not line.strip(): continue
+                record = json.loads(line)
+                parent_id = record.get('parent_id') or self.root_id
+                yield parent_id, record, record['id']
+
+    def __load(self):
+        with open(self.__filename, encoding='utf-8') as file:
+            return json.load(file)
+
+    def __load_layout(self):
+        """Return saved positions by item ids, none without the file."""
+        if not os.path.exists(self.__layout_filename): return {}
+        with open(self.__layout_filename, encoding='utf-8') as file:
+            return {item_id: (x, y) for item_id, x, y in json.load(file)}
+
+    def __iter_nested(self, data):
+        records = data if isinstance(data, list) else data.get('children', [])
+        ids = count(max(self.__given_ids(records), default=0) + 1)
+        stack = [(self.root_id, record) for record in reversed(records)]
+        while stack:
+            parent_id, record = stack.pop()
+            item_id = record.get('id')
+            if item_id is None: item_id = next(ids)
+            yield parent_id, record, item_id
+            children = record.get('children', ())
+            stack += [(item_id, child) for child in reversed(children)]
+
+    @staticmethod
+    def __given_ids(records):
+        stack = list(records)
+        while stack:
+            record = stack.pop()
+            if record.get('id') is not None: yield record['id']
+            stack += record.get('children', ())
+
+    def shift(self, items, parent):
+        for item in items: self.__shifts[item.id] = parent.id
+
+    def save_layout(self, positions): self.__positions.update(positions)
+
+    def flush(self):
+        if self.__positions:
+            positions = self.__load_layout()
+            positions.update(self.__positions)
+            layout = [[item_id, *xy] for item_id, xy in positions.items()]
+            self.__replace(self.__layout_filename, json.dump, layout)
+            self.__positions = {}
+        if self.__shifts:
+            write = self.__write_flat if self.__flat else self.__write_nested
+            self.__replace(self.__filename, write)
+            self.__shifts = {}
+
+    @staticmethod
+    def __replace(filename, write, *args):
+        """Write the file by the function through a temporary one."""
+        temporary = filename + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            write(*args, file)
+        os.replace(temporary, filename)
+
+    def __write_flat(self, file):
+        shifts = self.__shifts
+        for parent_id, record, item_id in self.__iter_flat():
+            parent_id = shifts.get(item_id, parent_id)
+            record['parent_id'] = parent_id or None
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def __write_nested(self, file):
+        data = self.__load()
+        shifts = self.__shifts
+        children = {}
+        for parent_id, record, item_id in list(self.__iter_nested(data)):
+            parent_id = shifts.get(item_id, parent_id)
+            # as the order of appearance changes
+            record['id'] = item_id
+            record['children'] = []
+            children.setdefault(parent_id, []).append(record)
+        for parent_id, records in children.items():
+            for record in records:
+                record['children'] = children.get(record['id'], [])
+                if not record['children']: del record['children']
+        root_children = children.get(self.root_id, [])
+        if isinstance(data, list):
+            data = root_children
+        else:
+            data['children'] = root_children
+        json.dump(data, file, ensure_ascii=False, indent=1)
@@ -1,3 +1,9 @@
+from random import Random
+from math import pi, sqrt
+
+import numpy as np
+
+
 # specific area = 1 / density
 # https://en.wikipedia.org/wiki/Circle_packing_in_a_circle
 _PACKING_SPECIFIC_AREA = {
@@ -32,6 +38,12 @@ def outersected(child_radius, parent_radius, distance):
     return min(depth/diameter, 1.0)
 
 
+def outersected_array(child_radii, parent_radius, distances):
+    """Vectorized version of outersected() for NumPy arrays."""
+    depths = distances + child_radii - parent_radius
+    return np.clip(depths / (2.0*child_radii), 0.0, 1.0)
+
+
 def intersected(child_radius, parent_radius, distance):
     depth = parent_radius + child_radius - distance  # of intersection
     diameter = 2.0 * child_radius
@@ -40,6 +52,13 @@ def intersected(child_radius, parent_radius, distance):
     return max(depth/diameter, 0.0)
 
 
+# fitted to front-chain packings of mixed circles polished by the physics:
+# density = _DENSITY_LIMIT * (1 - _DENSITY_BOUNDARY/sqrt(effective number)),
+# continuous with the table at its last entry
+_DENSITY_LIMIT = 0.84
+_DENSITY_BOUNDARY = 0.491
+
+
 def packing_specific_area(radii):
     """
     Returns the ratio of enclosing circle’s sufficient area
@@ -49,5 +68,302 @@ def packing_specific_area(radii):
     if number == 2:
         # exact solution
         return sum(radii)**2 / sum(r*r for r in radii)
-    max_key = max(_PACKING_SPECIFIC_AREA)
-    return _PACKING_SPECIFIC_AREA[min(number, max_key)]
+    if number in _PACKING_SPECIFIC_AREA:
+        return _PACKING_SPECIFIC_AREA[number]
+    areas = [r*r for r in radii]
+    return _fitted_specific_area(sum(areas)**2 / sum(a*a for a in areas))
+
+
+def _fitted_specific_area(effective_number):
+    """
+    Returns the specific area of many circles, where the effective number
+    (sum of areas)²/(sum of squared areas) accounts for mixed radii.
+    """
+    effective_number = max(effective_number, max(_PACKING_SPECIFIC_AREA))
+    boundary = _DENSITY_BOUNDARY / sqrt(effective_number)
+    return 1.0 / (_DENSITY_LIMIT * (1.0 - boundary))
+
+
+class EnclosedAreas:
+    """
+    Running sums of the enclosed circles areas, updated when circles
+    are added, removed or resized, for the enclosing area estimation.
+    """
+
+    __slots__ = ('__number', '__sum', '__squares_sum', '__top2')
+
+    def __init__(self, areas=()):
+        self.__number = 0
+        self.__sum = 0.0
+        self.__squares_sum = 0.0
+        # two largest areas, None when the largest one was removed
+        self.__top2 = [0.0, 0.0]
+        for area in areas: self.add(area)
+
+    def add(self, area):
+        self.__number += 1
+        self.__sum += area
+        self.__squares_sum += area*area
+        top2 = self.__top2
+        if top2 is None: return
+        if area > top2[0]: top2[:] = area, top2[0]
+        elif area > top2[1]: top2[1] = area
+
+    def remove(self, area):
+        self.__number -= 1
+        self.__sum -= area
+        self.__squares_sum -= area*area
+        if not self.__number: self.__init__()
+        elif self.__top2 and area >= self.__top2[1]: self.__top2 = None
+
+    def replace(self, old_area, new_area):
+        self.remove(old_area)
+        self.add(new_area)
+
+    def __rescan(self, areas):
+        """Recalculate sums from scratch, also to drop rounding errors."""
+        self.__init__()
+        for area in areas: self.add(area)
+
+    def enclosing_area(self, self_area, areas):
+        """
+        Returns the sufficient area of a circle that has own area
+        and encloses the circles. Their areas are iterated only when
+        one of the two largest circles was removed.
+        """
+        if self.__top2 is None: self.__rescan(areas)
+        number, areas_sum = self.__number, self.__sum
+        if not number: return self_area
+        area1 = self_area + areas_sum
+        if number == 1: return area1
+        top2 = self.__top2
+        if number == 2:
+            radii = [sqrt(area/pi) for area in top2]
+            area2 = packing_specific_area(radii) * areas_sum
+        elif number in _PACKING_SPECIFIC_AREA:
+            area2 = _PACKING_SPECIFIC_AREA[number] * areas_sum
+        else:
+            effective_number = areas_sum*areas_sum / self.__squares_sum
+            area2 = _fitted_specific_area(effective_number) * areas_sum
+        top2radii = sqrt(top2[0]/pi) + sqrt(top2[1]/pi)
+        area3 = pi * top2radii * top2radii
+        return max(area1, area2, area3)
+
+
+def enclosing_area(self_area, areas):
+    """
+    Returns the sufficient area of a circle that has own area
+    and encloses circles with the areas.
+    """
+    return EnclosedAreas(areas).enclosing_area(self_area, areas)
+
+
+class _FrontChainNode:
+
+    __slots__ = ('circle', 'next', 'previous')
+
+    def __init__(self, circle):
+        self.circle = circle
+        self.next: _FrontChainNode = None
+        self.previous: _FrontChainNode = None
+
+
+def _place(b, a, c):
+    """Place circle c tangent to circles a and b."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    d2 = dx*dx + dy*dy
+    if not d2:
+        c[0], c[1] = a[0] + c[2], a[1]
+        return
+    a2 = (a[2] + c[2])**2
+    b2 = (b[2] + c[2])**2
+    if a2 > b2:
+        x = (d2 + b2 - a2) / (2.0*d2)
+        y = sqrt(max(0.0, b2/d2 - x*x))
+        c[0], c[1] = b[0] - x*dx - y*dy, b[1] - x*dy + y*dx
+    else:
+        x = (d2 + a2 - b2) / (2.0*d2)
+        y = sqrt(max(0.0, a2/d2 - x*x))
+        c[0], c[1] = a[0] + x*dx - y*dy, a[1] + x*dy + y*dx
+
+
+def _intersects(a, b):
+    dr = a[2] + b[2] - 1e-6
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    return dr > 0.0 and dr*dr > dx*dx + dy*dy
+
+
+def _score(node):
+    """Squared distance to origin of the tangency point with next."""
+    a, b = node.circle, node.next.circle
+    ab = a[2] + b[2]
+    dx = (a[0]*b[2] + b[0]*a[2]) / ab
+    dy = (a[1]*b[2] + b[1]*a[2]) / ab
+    return dx*dx + dy*dy
+
+
+def _pack_front_chain(circles):
+    """
+    Place circles [x, y, r] tangent to each other by the front-chain
+    algorithm (Wang et al., 2006), following d3-hierarchy’s packSiblings.
+    """
+    circles_len = len(circles)
+    a = circles[0]
+    if circles_len == 1: return
+    b = circles[1]
+    a[0], b[0], b[1] = -b[2], a[2], 0.0
+    if circles_len == 2: return
+    _place(b, a, circles[2])
+    a, b, c = (_FrontChainNode(circle) for circle in circles[:3])
+    a.next = c.previous = b
+    b.next = a.previous = c
+    c.next = b.previous = a
+    i = 3
+    while i < circles_len:
+        _place(a.circle, b.circle, circles[i])
+        c = _FrontChainNode(circles[i])
+        # find the closest intersecting circle on the front-chain
+        j, k = b.next, a.previous
+        sj, sk = b.circle[2], a.circle[2]
+        while True:
+            if sj <= sk:
+                if _intersects(j.circle, c.circle):
+                    b = j
+                    break
+                sj += j.circle[2]
+                j = j.next
+            else:
+                if _intersects(k.circle, c.circle):
+                    a = k
+                    break
+                sk += k.circle[2]
+                k = k.previous
+            if j is k.next:
+                j = None
+                break
+        if j is not None:  # intersection found, retry between a and b
+            a.next, b.previous = b, a
+            continue
+        # insert the new circle between a and b
+        c.previous, c.next = a, b
+        a.next = b.previous = b = c
+        # compute the new closest circle pair to the centroid
+        aa = _score(a)
+        c = c.next
+        while c is not b:
+            ca = _score(c)
+            if ca < aa: a, aa = c, ca
+            c = c.next
+        b = a.next
+        i += 1
+
+
+def _encloses_not(a, b):
+    dr = a[2] - b[2]
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    return dr < 0.0 or dr*dr < dx*dx + dy*dy
+
+
+def _encloses_weak(a, b):
+    dr = a[2] - b[2] + max(a[2], b[2], 1.0)*1e-9
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    return dr > 0.0 and dr*dr > dx*dx + dy*dy
+
+
+def _encloses_weak_all(a, basis):
+    return all(_encloses_weak(a, b) for b in basis)
+
+
+def _enclose_basis_2(a, b):
+    x1, y1, r1 = a
+    x2, y2, r2 = b
+    x21, y21, r21 = x2 - x1, y2 - y1, r2 - r1
+    l = sqrt(x21*x21 + y21*y21)
+    return (
+        (x1 + x2 + x21/l*r21) / 2.0,
+        (y1 + y2 + y21/l*r21) / 2.0,
+        (l + r1 + r2) / 2.0,
+    )
+
+
+def _enclose_basis_3(a, b, c):
+    x1, y1, r1 = a
+    x2, y2, r2 = b
+    x3, y3, r3 = c
+    a2, a3 = x1 - x2, x1 - x3
+    b2, b3 = y1 - y2, y1 - y3
+    c2, c3 = r2 - r1, r3 - r1
+    d1 = x1*x1 + y1*y1 - r1*r1
+    d2 = d1 - x2*x2 - y2*y2 + r2*r2
+    d3 = d1 - x3*x3 - y3*y3 + r3*r3
+    ab = a3*b2 - a2*b3
+    xa = (b2*d3 - b3*d2) / (ab*2.0) - x1
+    xb = (b3*c2 - b2*c3) / ab
+    ya = (a3*d2 - a2*d3) / (ab*2.0) - y1
+    yb = (a2*c3 - a3*c2) / ab
+    qa = xb*xb + yb*yb - 1.0
+    qb = 2.0 * (r1 + xa*xb + ya*yb)
+    qc = xa*xa + ya*ya - r1*r1
+    if abs(qa) > 1e-6:
+        r = -(qb + sqrt(max(0.0, qb*qb - 4.0*qa*qc))) / (2.0*qa)
+    else:
+        r = -qc / qb
+    return (x1 + xa + xb*r, y1 + ya + yb*r, r)
+
+
+def _enclose_basis(basis):
+    if len(basis) == 1: return tuple(basis[0])
+    if len(basis) == 2: return _enclose_basis_2(*basis)
+    return _enclose_basis_3(*basis)
+
+
+def _extend_basis(basis, p):
+    if _encloses_weak_all(p, basis): return [p]
+    for b in basis:
+        if _encloses_not(p, b) and \
+                _encloses_weak_all(_enclose_basis_2(b, p), basis):
+            return [b, p]
+    for i, bi in enumerate(basis[:-1]):
+        for bj in basis[i+1:]:
+            if _encloses_not(_enclose_basis_2(bi, bj), p) and \
+                    _encloses_not(_enclose_basis_2(bi, p), bj) and \
+                    _encloses_not(_enclose_basis_2(bj, p), bi) and \
+                    _encloses_weak_all(_enclose_basis_3(bi, bj, p), basis):
+                return [bi, bj, p]
+    raise ValueError('circles can not be enclosed')
+
+
+def enclosing_circle(circles):
+    """
+    Returns the smallest circle (x, y, r) enclosing the circles
+    by Welzl’s algorithm, following d3-hierarchy’s packEnclose.
+    """
+    circles = list(circles)
+    Random(0).shuffle(circles)
+    basis, enclosing = [], None
+    i = 0
+    while i < len(circles):
+        p = circles[i]
+        if enclosing and _encloses_weak(enclosing, p):
+            i += 1
+        else:
+            basis = _extend_basis(basis, p)
+            enclosing = _enclose_basis(basis)
+            i = 0
+    return enclosing
+
+
+def pack_circles(radii):
+    """
+    Returns centers of tightly packed circles with the radii
+    around the origin. Larger circles are placed first.
+    """
+    if not radii: return []
+    order = sorted(range(len(radii)), key=radii.__getitem__, reverse=True)
+    circles = [[0.0, 0.0, radii[index]] for index in order]
+    _pack_front_chain(circles)
+    x0, y0, _ = enclosing_circle(circles)
+    centers = [None] * len(radii)
+    for index, (x, y, _) in zip(order, circles):
+        centers[index] = (x - x0, y - y0)
+    return centers
@@ -0,0 +1,81 @@
+from collections import deque
+from time import perf_counter, sleep
+from typing import NamedTuple
+
+
+# seconds before the deadline to stop sleeping, as sleep may be as coarse
+# as 15 ms (Windows, Python before 3.11), and to wait for it spinning
+_SPIN_TIME = 0.002
+
+
+class FrameStatistics(NamedTuple):
+    frames: int
+    dropped_frames: int
+    # seconds of work per frame, without sleeping
+    p50_step_time: float
+    p99_step_time: float
+
+
+def _percentile(sorted_values, percent):
+    """Return the nearest-rank percentile of the non-empty sorted values."""
+    index = round(percent/100 * (len(sorted_values)-1))
+    return sorted_values[index]
+
+
+class FramePacer:
+    """
+    Starts frames at the frame rate by sleeping until shortly before
+    their deadlines and spinning until them.
+    Deadlines are on the grid of frame periods, so oversleeping is not
+    accumulated; a late frame is followed by the next one at once, and
+    the grid is moved when frames are more than a period behind,
+    counting the skipped periods as dropped frames.
+    """
+
+    def __init__(self, history=1000):
+        self.__step_times = deque(maxlen=history)
+        self.__frames = 0
+        self.__dropped_frames = 0
+        self.__deadline = self.__frame_start = perf_counter()
+
+    def start(self):
+        """Start the first frame now and forget the statistics."""
+        self.__step_times.clear()
+        self.__frames = self.__dropped_frames = 0
+        self.__deadline = self.__frame_start = perf_counter()
+
+    def tick(self, fps):
+        """Finish the frame and sleep until the next frame deadline."""
+        now = perf_counter()
+        self.__step_times.append(now - self.__frame_start)
+        self.__frames += 1
+        period = 1.0 / fps
+        deadline = self.__deadline + period
+        behind = now - deadline
+        if behind >= period:
+            self.__dropped_frames += int(behind/period)
+            deadline = now
+        elif behind < 0.0:
+            self.__wait_until(deadline)
+        self.__deadline = deadline
+        self.__frame_start = perf_counter()
+
+    @staticmethod
+    def __wait_until(deadline):
+        rest = deadline - perf_counter() - _SPIN_TIME
+        if rest > 0.0: sleep(rest)
+        # yielding the GIL to the other threads
+        while perf_counter() < deadline: sleep(0)
+
+    def statistics(self):
+        """
+        Return numbers of frames since the start, step time percentiles
+        of the recent ones.
+        """
+        step_times = sorted(self.__step_times) or [0.0]
+        return FrameStatistics(
+            self.__frames,
+            self.__dropped_frames,
+            _percentile(step_times, 50),
+            _percentile(step_times, 99),
+        )
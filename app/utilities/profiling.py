@@ -0,0 +1,162 @@
+import csv
+import json
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from threading import get_ident
+from time import perf_counter
+from typing import Dict, NamedTuple, Tuple
+
+
+_NO_PHASE = nullcontext()
+_CSV_FIELDS = (
+    'frame', 'thread', 'phase', 'container_id',
+    'start', 'duration', 'awake_bodies', 'contacts',
+)
+
+
+class ProfileSummary(NamedTuple):
+    # milliseconds per frame by phase
+    phase_times: Dict[str, float]
+    awake_bodies: int
+    contacts: int
+    # container id and milliseconds per its step
+    slowest_subworld: Tuple[int, float]
+
+
+class _Event(NamedTuple):
+    frame: int
+    thread: int
+    phase: str
+    container_id: int
+    start: float
+    duration: float
+    awake_bodies: int
+    contacts: int
+
+
+class Profiler:
+    """
+    Records durations of frame phases and subworld steps with counts
+    of awake bodies and contacts, while enabled. Events of the last
+    frames are kept for summaries and export.
+    """
+
+    def __init__(self, history=200000):
+        self.__enabled = False
+        self.__events = deque(maxlen=history)
+        self.__frame = 0
+        self.__origin = perf_counter()
+        # emission times of signals not received yet
+        self.__emitted = deque()
+
+    @property
+    def enabled(self):
+        """Whether events are recorded, enabling starts anew."""
+        return self.__enabled
+
+    @enabled.setter
+    def enabled(self, enabled):
+        if enabled and not self.__enabled:
+            self.__events.clear()
+            self.__emitted.clear()
+            self.__frame = 0
+            self.__origin = perf_counter()
+        self.__enabled = enabled
+
+    def next_frame(self): self.__frame += 1
+
+    def __record(
+        self, phase, start, duration,
+        container_id=None, awake_bodies=None, contacts=None,
+    ):
+        self.__events.append(_Event(
+            self.__frame, get_ident(), phase, container_id,
+            start - self.__origin, duration, awake_bodies, contacts,
+        ))
+
+    def phase(self, name):
+        """Return context manager timing the phase, if enabled."""
+        return self.__phase(name) if self.__enabled else _NO_PHASE
+
+    @contextmanager
+    def __phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.__record(name, start, perf_counter() - start)
+
+    def record_subworld(
+        self, container_id, start, duration, awake_bodies, contacts
+    ):
+        self.__record(
+            'subworld', start, duration, container_id, awake_bodies, contacts
+        )
+
+    def signal_emitted(self):
+        if self.__enabled: self.__emitted.append(perf_counter())
+
+    def signal_received(self, name):
+        """Record the time from the emission of the queued signal."""
+        if not self.__enabled or not self.__emitted: return
+        start = self.__emitted.popleft()
+        self.__record(name, start, perf_counter() - start)
+
+    def summary(self, frames=30):
+        """Summarize the last complete frames."""
+        events = list(self.__events)
+        last_frame = self.__frame - 1
+        first_frame = max(last_frame - frames, 0) + 1
+        frames = last_frame - first_frame + 1
+        phase_times, subworld_times = {}, {}
+        awake_bodies = contacts = 0
+        for event in reversed(events):
+            if event.frame > last_frame: continue
+            if event.frame < first_frame: break
+            milliseconds = event.duration * 1000
+            if event.container_id is None:
+                phase_times[event.phase] = \
+                    phase_times.get(event.phase, 0.0) + milliseconds/frames
+                continue
+            subworld_times[event.container_id] = max(
+                subworld_times.get(event.container_id, 0.0), milliseconds
+            )
+            if event.frame == last_frame:
+                awake_bodies += event.awake_bodies
+                contacts += event.contacts
+        slowest = max(
+            subworld_times.items(), key=lambda item: item[1],
+            default=(None, 0.0),
+        )
+        return ProfileSummary(phase_times, awake_bodies, contacts, slowest)
+
+    def export_csv(self, filename):
+        """Write the events with times in seconds from the enabling."""
+        with open(filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(_CSV_FIELDS)
+            writer.writerows(list(self.__events))
+
+    def export_chrome_trace(self, filename):
+        """Write the events in the Trace Event Format of chrome://tracing."""
+        trace_events = []
+        for event in list(self.__events):
+            trace_event = {
+                'name': event.phase,
+                'ph': 'X',  # complete event
+                'ts': event.start * 1e6,  # microseconds
+                'dur': event.duration * 1e6,
+                'pid': 0,
+                'tid': event.thread,
+                'args': {'frame': event.frame},
+            }
+            if event.container_id is not None:
+                trace_event['name'] = f'subworld {event.container_id}'
+                trace_event['args'].update(
+                    container_id=event.container_id,
+                    awake_bodies=event.awake_bodies,
+                    contacts=event.contacts,
+                )
+            trace_events.append(trace_event)
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': trace_events}, file)
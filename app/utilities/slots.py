@@ -0,0 +1,17 @@
+def slots_of(*bases):
+    """
+    Return __slots__ for a class of the bases: names of the attributes
+    that the bases and their ancestors list in their own _SLOTS, private
+    ones mangled by the listing class, except the ones already in slots.
+    """
+    classes = dict.fromkeys(cls for base in bases for cls in base.__mro__)
+    slotted = {
+        name for cls in classes for name in vars(cls).get('__slots__', ())
+    }
+    names = []
+    for cls in classes:
+        for name in vars(cls).get('_SLOTS', ()):
+            if name.startswith('__') and not name.endswith('__'):
+                name = f"_{cls.__name__.lstrip('_')}{name}"
+            if name not in slotted and name not in names: names.append(name)
+    return tuple(names)
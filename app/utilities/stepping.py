@@ -0,0 +1,76 @@
+_DEFAULT_ITERATIONS = (10, 10)  # velocity and position
+_CALM_ITERATIONS = (3, 3)
+# iterations scale factors when the frame is over or well within budget
+_SCALE_DOWN = 0.8
+_SCALE_UP = 1.1
+_WITHIN_BUDGET = 0.7
+
+
+class SteppingPolicy:
+    """
+    Plans subworld steps: fewer solver iterations for calm subworlds,
+    substeps for the dragged ones, and fewer iterations of all steps
+    while frames take longer than the budget.
+    """
+
+    def __init__(
+        self,
+        iterations=_DEFAULT_ITERATIONS,
+        calm_iterations=_CALM_ITERATIONS,
+        calm_speed=0.05,
+        drag_substeps=3,
+        frame_budget=None,
+        min_scale=0.2,
+    ):
+        self.iterations = iterations
+        self.calm_iterations = calm_iterations
+        # root mean square speed of children in parent radii per second
+        self.calm_speed = calm_speed
+        self.drag_substeps = drag_substeps
+        # seconds per frame, None not to watch the frame cost
+        self.frame_budget = frame_budget
+        self.min_scale = min_scale
+        self.__scale = 1.0
+        self.__overloaded = False
+
+    @property
+    def scale(self):
+        """Factor of solver iterations, lowered while over budget."""
+        return self.__scale
+
+    @property
+    def overloaded(self):
+        """Whether the frame is over budget even with fewest iterations."""
+        return self.__overloaded
+
+    def plan(self, kinetic_energy, mass, radius, dragged=False):
+        """
+        Return velocity iterations, position iterations and number
+        of substeps for the subworld of the radius, whose children
+        have the total mass and kinetic energy.
+        """
+        if dragged:
+            iterations, substeps = self.iterations, self.drag_substeps
+        elif kinetic_energy <= 0.5*mass * (self.calm_speed*radius)**2:
+            iterations, substeps = self.calm_iterations, 1
+        else:
+            iterations, substeps = self.iterations, 1
+        scale = self.__scale
+        if scale == 1.0: return (*iterations, substeps)
+        velocity_iterations, position_iterations = iterations
+        return (
+            max(1, round(velocity_iterations*scale)),
+            max(1, round(position_iterations*scale)),
+            substeps,
+        )
+
+    def frame_done(self, frame_cost):
+        """Adapt the iterations scale to the seconds the frame took."""
+        budget = self.frame_budget
+        if budget is None: return
+        if frame_cost > budget:
+            self.__overloaded = self.__scale == self.min_scale
+            self.__scale = max(self.min_scale, self.__scale*_SCALE_DOWN)
+        elif frame_cost < budget*_WITHIN_BUDGET:
+            self.__overloaded = False
+            self.__scale = min(1.0, self.__scale*_SCALE_UP)
@@ -0,0 +1,49 @@
+from threading import Lock
+
+import numpy as np
+
+
+class ColumnStore:
+    """
+    Structure of arrays with a row per item: each column is a NumPy array
+    with the rows as its first axis. Columns grow by doubling and are
+    replaced then, so they are read from the store after the rows, and
+    written from other threads than the one adding rows under the lock.
+    """
+
+    def __init__(self, capacity=1024):
+        self.__capacity = capacity
+        self.__length = 0
+        self.__fills = {}
+        self.lock = Lock()
+
+    def __len__(self): return self.__length
+
+    def add_column(self, name, dtype=float, width=None, fill=0):
+        """Add the column of the fill values as the store attribute."""
+        shape = (self.__capacity,) if width is None \
+            else (self.__capacity, width)
+        setattr(self, name, np.full(shape, fill, dtype))
+        self.__fills[name] = fill
+
+    def add_row(self, **values):
+        """
+        Return the index of the new row of the values by column names,
+        and of the fill values in the other columns.
+        """
+        if self.__length == self.__capacity:
+            with self.lock: self.__grow()
+        row = self.__length
+        for name, value in values.items(): getattr(self, name)[row] = value
+        self.__length += 1  # the row is complete
+        return row
+
+    def __grow(self):
+        capacity = self.__capacity
+        for name, fill in self.__fills.items():
+            column = getattr(self, name)
+            shape = (2*capacity, *column.shape[1:])
+            grown = np.full(shape, fill, column.dtype)
+            grown[:capacity] = column
+            setattr(self, name, grown)
+        self.__capacity = 2 * capacity